@@ -24,6 +24,10 @@ import socket
 import threading
 import traceback
 import paramiko as ssh
+import paramiko.dsskey
+import paramiko.rsakey
+import paramiko.ecdsakey
+import paramiko.ed25519key
 
 __author__ = 'Christian Hopps'
 __date__ = 'December 14 2016'
@@ -34,6 +38,42 @@ logger = logging.getLogger(__name__)
 # Used by travis-ci testing
 _private_key = None
 
+# The SSH channel window and maximum packet size advertised to the server. The paramiko defaults
+# are small enough that bulk transfers stall waiting on window adjusts each round-trip.
+WINDOW_SIZE = 2**31 - 1
+MAX_PACKET_SIZE = 2**19
+
+# Socket options for directly connected (i.e., non-proxied) ssh sockets. Disable Nagle so small
+# SSH packets aren't delayed; the buffer sizes are left to the OS (which autotunes) if `None`.
+TCP_NODELAY = True
+SOCKET_SNDBUF = None
+SOCKET_RCVBUF = None
+
+
+def _set_socket_options(sock):
+    if TCP_NODELAY:
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    if SOCKET_SNDBUF:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, SOCKET_SNDBUF)
+    if SOCKET_RCVBUF:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, SOCKET_RCVBUF)
+
+
+def from_private_key_file(keyfile, password=None):
+    """Return a private key from a file, try all the types."""
+    keyclasses = [
+        paramiko.rsakey.RSAKey, paramiko.dsskey.DSSKey, paramiko.ecdsakey.ECDSAKey,
+        paramiko.ed25519key.Ed25519Key
+    ]
+    for cl in keyclasses:
+        try:
+            return cl.from_private_key_file(keyfile, password)
+        except paramiko.PasswordRequiredException:
+            # The key is the right type but encrypted, other types won't do better.
+            raise
+        except paramiko.SSHException:
+            continue
+
 
 def _socket_is_remote_closed(sock):
     try:
@@ -110,6 +150,8 @@ class _SSHConnectionCache(object):
                 af, socktype, proto, unused_name, sa = addrinfo
                 try:
                     ossock = socket.socket(af, socktype, proto)
+                    # Buffer sizes must be set prior to connect to affect TCP window scaling.
+                    _set_socket_options(ossock)
                     ossock.connect(sa)
                     if attempt:
                         logger.debug("Succeeded after %s attempts to : %s", str(attempt),
@@ -133,13 +175,18 @@ class _SSHConnectionCache(object):
             raise
 
     @classmethod
-    def _open_ssh_socket(cls, host, port, username, password, use_config, debug, proxy):
+    def _open_ssh_socket(cls, host, port, username, password, use_config, debug, proxy,
+                         compress=False):
         ossock = cls.open_os_socket(host, port, use_config, debug, proxy)
         try:
             if debug:
                 logger.debug("Opening SSH socket to %s:%s", str(host), str(port))
 
-            sshsock = ssh.Transport(ossock)
+            sshsock = ssh.Transport(
+                ossock, default_window_size=WINDOW_SIZE, default_max_packet_size=MAX_PACKET_SIZE)
+            if compress:
+                # Must be requested prior to key negotiation in start_client.
+                sshsock.use_compression(True)
             # self.ssh.set_missing_host_key_policy(ssh.AutoAddPolicy())
 
             # XXX this takes an event so we could yield here to wait for event.
@@ -227,7 +274,8 @@ class _SSHConnectionCache(object):
     def release_ssh_socket(self, ssh_socket, debug):
         raise NotImplementedError("release_ssh_socket")
 
-    def get_ssh_socket(self, host, port, username, password, debug, proxycmd=None):
+    def get_ssh_socket(self, host, port, username, password, debug, proxycmd=None,
+                       compress=False):
         raise NotImplementedError("get_ssh_socket")
 
 
@@ -242,10 +290,11 @@ class SSHNoConnectionCache(_SSHConnectionCache):
         ssh_socket.close()
         ossock.close()
 
-    def get_ssh_socket(self, host, port, username, password, debug, proxycmd=None):
+    def get_ssh_socket(self, host, port, username, password, debug, proxycmd=None,
+                       compress=False):
         # True below is to use users ssh config, should this be part of get_ssh_socket API?
         ossock, sshsock = _SSHConnectionCache._open_ssh_socket(host, port, username, password, True,
-                                                               debug, proxycmd)
+                                                               debug, proxycmd, compress)
         sshsock.os_socket = ossock
         return sshsock
 
@@ -272,7 +321,8 @@ class SSHConnectionCache(_SSHConnectionCache):
         self.ssh_socket_timeout = {}
         self.ssh_sockets_lock = threading.Lock()
 
-    def get_ssh_socket(self, host, port, username, password, debug, proxycmd=None):
+    def get_ssh_socket(self, host, port, username, password, debug, proxycmd=None,
+                       compress=False):
         """Returns a socket to the given host using the given credentials.
 
         If a socket has already been opened with the supplied arguments, then it will be reference
@@ -286,12 +336,13 @@ class SSHConnectionCache(_SSHConnectionCache):
         :param password: The password/key for authentication or None.
         :param debug: Boolean indicating if debug messages should be enabled.
         :param proxycmd: A proxy command to use when making the ssh connection.
+        :param compress: True to enable compression on a newly opened connection.
         :raises: ssh.AuthenticationException
 
         """
         # Return an open ssh socket if we have one.
 
-        key = "{}:{}@{}:{}".format(host, port, username, proxycmd)
+        key = "{}:{}@{}:{}:{}".format(host, port, username, proxycmd, compress)
         with self.ssh_sockets_lock:
             if debug:
                 logger.debug("Searching for \"%s\" in open ssh socket cache", key)
@@ -331,7 +382,7 @@ class SSHConnectionCache(_SSHConnectionCache):
             # True below is to use users ssh config, should this be part of get_ssh_socket
             # API?
             ossock, sshsock = _SSHConnectionCache._open_ssh_socket(host, port, username, password,
-                                                                   True, debug, proxycmd)
+                                                                   True, debug, proxycmd, compress)
 
             if key not in self.ssh_sockets:
                 self.ssh_sockets[key] = []
@@ -84,7 +84,8 @@ class SSHCommand(conn.SSHConnection):
                  password=None,
                  debug=False,
                  cache=None,
-                 proxycmd=None):
+                 proxycmd=None,
+                 compress=False):
         """An command to execute over an ssh connection.
 
         :param command: The shell command to execute.
@@ -98,6 +99,7 @@ class SSHCommand(conn.SSHConnection):
         :param cache: A connection cache to use.
         :type cache: SSHConnectionCache
         :param proxycmd: Proxy command to use when making the ssh connection.
+        :param compress: True to enable compression on the ssh connection.
         """
         self.command = command
         self.exit_code = None
@@ -105,7 +107,8 @@ class SSHCommand(conn.SSHConnection):
         self.debug = debug
         self.error_output = ""
 
-        super(SSHCommand, self).__init__(host, port, username, password, debug, cache, proxycmd)
+        super(SSHCommand, self).__init__(host, port, username, password, debug, cache, proxycmd,
+                                         compress)
 
     def _get_pty(self):
         width, height = terminal_size()
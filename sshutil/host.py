@@ -16,20 +16,72 @@
 #
 from __future__ import absolute_import, division, unicode_literals, print_function, nested_scopes
 import functools
+import getpass
+import io
+import logging
+import os
+import posixpath
+import shutil
+import threading
 import paramiko as ssh
-from sshutil.cmd import shell_escape_single_quote, SSHCommand, ShellCommand
+from sshutil.cmd import SSHCommand, ShellCommand
 from sshutil.conn import SSHClientSession
+from sshutil.cache import from_private_key_file
+
+try:
+    from shlex import quote as shell_quote
+except ImportError:
+    from pipes import quote as shell_quote
+
+try:
+    _string_types = (str, unicode)  # pylint: disable=E0602
+except NameError:
+    _string_types = (str, )
 
 __author__ = 'Christian Hopps'
 __version__ = '1.0'
 __docformat__ = "restructuredtext en"
 
+logger = logging.getLogger(__name__)
+
+# Remote home directories keyed by (server, port, username, proxycmd) so we only ask once per
+# process.
+_cwd_cache = {}
+_cwd_cache_lock = threading.Lock()
+
+
+def _load_private_key(path):
+    """Return the private key in the file `path`, or `path` if it's not a usable key file.
+
+    :raises: ssh.PasswordRequiredException if the key is encrypted.
+    """
+    try:
+        pkey = from_private_key_file(path)
+    except ssh.PasswordRequiredException:
+        raise
+    except (ssh.SSHException, ValueError, UnicodeDecodeError, IOError, OSError) as error:
+        # Don't log the path or error text, the path is about to be used as a password.
+        logger.debug("Password is not a loadable private key file (%s)", error.__class__.__name__)
+        pkey = None
+    if pkey is None:
+        return path
+    return pkey
+
 
 class Host(object):
     """A Host object is either local (shell) or remote host (ssh) and provides easy access to the given
     host for running commands etc.
+
+    Commands are run from `cwd` and passed verbatim to the remote user's login shell (or to bash
+    for the local host).
     """
 
+    #: Size of the buffer used to read a local file when copying it to the host.
+    BLOCK_SIZE = 1024 * 1024
+
+    #: Maximum number of outstanding sftp read requests when copying a file from the host.
+    MAX_PREFETCH = 64
+
     def __init__(self,
                  server=None,
                  port=22,
@@ -38,68 +90,143 @@ class Host(object):
                  password=None,
                  debug=False,
                  cache=None,
-                 proxycmd=None):
+                 proxycmd=None,
+                 compress=False):
         """Get a 'connection' to a host (local or remote)
 
         :param server: The host to execute commands on `None` for using the local shell.
         :param port: The ssh port to use.
         :param cwd: The directory commands should execute from.
         :param username: The username to authenticate with if `None` getpass.get_user() is used.
-        :param password: The password or public key to authenticate with.
-                         If `None` given will also try using an SSH agent.
+        :param password: The password or public key to authenticate with, a path to a private key
+                         file is loaded as the key. If `None` given will also try using an SSH
+                         agent.
         :type password: str or ssh.PKey
         :param debug: True to enable debug level logging.
         :param cache: A connection cache to use.
         :type cache: SSHConnectionCache
         :param proxycmd: Proxy command to use when making the ssh connection.
+        :param compress: True to enable compression on the ssh connection.
         """
 
         self.sftp = None
         self.sftp_session = None
         self.cwd = cwd
         if server:
-            self.cmd_class = functools.partial(
-                SSHCommand,
-                host=server,
-                port=port,
-                username=username,
-                password=password,
-                debug=debug,
-                cache=cache,
-                proxycmd=proxycmd)
-            self.session_class = functools.partial(
-                SSHClientSession,
+            # Accept the path of a private key file in place of a loaded key.
+            if isinstance(password, _string_types) and os.path.isfile(password):
+                password = _load_private_key(password)
+
+            self._cmd_cls = SSHCommand
+            self._session_cls = SSHClientSession
+            self._cmd_kwargs = dict(
                 host=server,
                 port=port,
                 username=username,
                 password=password,
                 debug=debug,
                 cache=cache,
-                proxycmd=proxycmd)
+                proxycmd=proxycmd,
+                compress=compress)
         else:
-            self.cmd_class = functools.partial(ShellCommand, debug=debug)
-            self.session_class = None
+            self._cmd_cls = ShellCommand
+            self._session_cls = None
+            self._cmd_kwargs = dict(debug=debug)
             # XXX we'd really like to pretend to be connected to localhost without
             # actually requiring ssh be functional for connect to localhost.
 
+        # Public ready-to-call constructors, kept for existing callers.
+        self.cmd_class = functools.partial(self._cmd_cls, **self._cmd_kwargs)
+        if self._session_cls:
+            self.session_class = functools.partial(self._session_cls, **self._cmd_kwargs)
+        else:
+            self.session_class = None
+
         if not self.cwd:
-            self.cwd = self.cmd_class("pwd").run().strip()
+            if server:
+                key = (server, port, username or getpass.getuser(), proxycmd)
+                with _cwd_cache_lock:
+                    self.cwd = _cwd_cache.get(key)
+                if not self.cwd:
+                    self.cwd = self._cmd_cls("pwd", **self._cmd_kwargs).run().strip()
+                    with _cwd_cache_lock:
+                        _cwd_cache[key] = self.cwd
+            else:
+                self.cwd = os.getcwd()
+
+    def __del__(self):
+        self.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        """Close any open sftp client and its underlying session."""
+        try:
+            if getattr(self, "sftp", None):
+                self.sftp.close()
+        finally:
+            self.sftp = None
+            if getattr(self, "sftp_session", None):
+                self.sftp_session.close()
+            self.sftp_session = None
 
     def _get_sftp(self):
+        """Return the sftp client for this host, opening it on first use.
+
+        The client is kept open for the life of the host (or until `close` is called) so that
+        multiple copies share a single sftp subsystem negotiation.
+        """
         if self.sftp is None:
-            self.sftp_session = self.session_class(subsystem="sftp")
+            self.sftp_session = self._session_cls(subsystem="sftp", **self._cmd_kwargs)
             try:
                 self.sftp = ssh.sftp_client.SFTPClient(self.sftp_session.chan)
-            except Exception as unused:
-                pass
-                # if debug:
-                #     import pdb
-                #     pdb.set_trace()
-            self.sftp.chdir(self.cwd)
+            except:
+                # Release the session so a later call can retry from scratch, without letting a
+                # failure to close hide the original error.
+                try:
+                    self.sftp_session.close()
+                except Exception as error:
+                    logger.debug("Ignoring error closing sftp session: %s", str(error))
+                self.sftp_session = None
+                raise
         return self.sftp
 
+    def _remote_path(self, remotefile):
+        # Rather than chdir the sftp client, relative paths are prefixed with our cwd.
+        return posixpath.join(self.cwd, remotefile)
+
+    def _put(self, sftp, localfile, remotefile):
+        """Copy a local file to the host using pipelined sftp writes."""
+        buf = memoryview(bytearray(self.BLOCK_SIZE))
+        size = 0
+        with io.open(localfile, "rb") as lf:
+            # Unbuffered so writes go straight out without another copy of the data.
+            with sftp.file(remotefile, "wb", 0) as rf:
+                rf.set_pipelined(True)
+                while True:
+                    n = lf.readinto(buf)
+                    if not n:
+                        break
+                    rf.write(buf[:n])
+                    size += n
+        rsize = sftp.stat(remotefile).st_size
+        if rsize != size:
+            raise IOError("size mismatch in copy!  {} != {}".format(rsize, size))
+
     def _get_cmd(self, command):
-        return "bash -c 'cd {} && {}'".format(self.cwd, shell_escape_single_quote(command))
+        command = "cd {} && {}".format(shell_quote(self.cwd), command)
+        if self._session_cls:
+            # sshd already executes the command using the user's shell.
+            return command
+        return "bash -c {}".format(shell_quote(command))
+
+    def _run(self, command, method):
+        """Run a command using the given run method of our command class."""
+        return getattr(self._cmd_cls(self._get_cmd(command), **self._cmd_kwargs), method)()
 
     def run_status_stderr(self, command):
         """Run the command returning exit code, stdout and stderr.
@@ -121,14 +248,14 @@ class Host(object):
         >>> print(error, end="")
         grep: doesnt-exist: No such file or directory
         """
-        return self.cmd_class(self._get_cmd(command)).run_status_stderr()
+        return self._run(command, "run_status_stderr")
 
     def run_status(self, command):
         """Run a command, return exitcode and stdout.
 
         :return: (status, stdout)
         """
-        return self.cmd_class(self._get_cmd(command)).run_status()
+        return self._run(command, "run_status")
 
     def run_stderr(self, command):
         """Run a command, return stdout and stderr,
@@ -136,7 +263,7 @@ class Host(object):
         :return: (stdout, stderr)
         :raises: CalledProcessError
         """
-        return self.cmd_class(self._get_cmd(command)).run_stderr()
+        return self._run(command, "run_stderr")
 
     def run(self, command):
         """Run a command, return stdout.
@@ -145,12 +272,42 @@ class Host(object):
         :raises: CalledProcessError
         """
 
-        return self.cmd_class(self._get_cmd(command)).run()
+        return self._run(command, "run")
 
     def copy_to(self, localfile, remotefile):
-        if self.session_class:
+        """Copy a local file to the host.
+
+        :param localfile: The path of the local file to copy.
+        :param remotefile: The path to copy to, relative paths are relative to `cwd`.
+        """
+        self.copy_many_to([(localfile, remotefile)])
+
+    def copy_many_to(self, pairs):
+        """Copy a list of local files to the host using a single sftp client.
+
+        :param pairs: An iterable of (localfile, remotefile) tuples.
+        """
+        if self._session_cls:
+            sftp = self._get_sftp()
+            for localfile, remotefile in pairs:
+                self._put(sftp, localfile, self._remote_path(remotefile))
+        else:
+            for localfile, remotefile in pairs:
+                shutil.copyfile(localfile, os.path.join(self.cwd, remotefile))
+
+    def copy_from(self, remotefile, localfile):
+        """Copy a file from the host to a local file.
+
+        :param remotefile: The path to copy from, relative paths are relative to `cwd`.
+        :param localfile: The path of the local file to copy to.
+        """
+        if self._session_cls:
             sftp = self._get_sftp()
-            sftp.put(localfile, remotefile)
+            remotefile = self._remote_path(remotefile)
+            if ssh.__version_info__ >= (3, 3):
+                # Bound the prefetch so concurrent transfers don't flood the transport.
+                sftp.get(remotefile, localfile, max_concurrent_prefetch_requests=self.MAX_PREFETCH)
+            else:
+                sftp.get(remotefile, localfile)
         else:
-            # XXX Invoke local version
-            pass
+            shutil.copyfile(os.path.join(self.cwd, remotefile), localfile)
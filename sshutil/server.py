@@ -26,27 +26,11 @@ import sys
 import threading
 import traceback
 import paramiko as ssh
-import paramiko.dsskey
-import paramiko.rsakey
-import paramiko.ecdsakey
-import paramiko.ed25519key
+from sshutil.cache import from_private_key_file
 
 logger = logging.getLogger(__name__)
 
 
-def from_private_key_file(keyfile, password=None):
-    """Return a private key from a file, try all the types."""
-    keyclasses = [
-        paramiko.rsakey.RSAKey, paramiko.dsskey.DSSKey, paramiko.ecdsakey.ECDSAKey,
-        paramiko.ed25519key.Ed25519Key
-    ]
-    for cl in keyclasses:
-        try:
-            return cl.from_private_key_file(keyfile, password)
-        except paramiko.SSHException:
-            continue
-
-
 def is_sock_closed(sock):
     """Check to see if the socket is ready for reading but nothing is there, IOW it's closed"""
     rds, _, _ = select.select([sock], [], [], 0)
@@ -370,8 +354,10 @@ class SSHServer(object):
         self.ports = {}
         self.host_key = None
 
-        # Load the host key for our ssh server.
-        if host_key:
+        # Load the host key for our ssh server, host_key may be a path or an already loaded key.
+        if isinstance(host_key, ssh.PKey):
+            self.host_key = host_key
+        elif host_key:
             assert os.path.exists(host_key)
             self.host_key = from_private_key_file(host_key)
         else:
@@ -465,8 +451,7 @@ class SSHServer(object):
                 if self.debug:
                     logger.debug("%s: Accepting connections", str(self))
 
-                #rfds, unused, unused = select.select([proto_sock, self.close_rsocket], [], [])
-                rfds, unused, unused = select.select([proto_sock], [], [])
+                rfds, unused, unused = select.select([proto_sock, self.close_rsocket], [], [])
                 if self.close_rsocket in rfds:
                     if self.debug:
                         logger.debug("%s: Got close notification closing down server", str(self))
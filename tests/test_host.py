@@ -18,8 +18,13 @@
 # limitations under the License.
 #
 from __future__ import absolute_import, division, unicode_literals, print_function, nested_scopes
+import logging
+import os
+import sys
+import paramiko as ssh
 import pytest
 from sshutil.cache import SSHConnectionCache, SSHNoConnectionCache
+import sshutil.host
 from sshutil.host import Host
 from testfunc import _run_variations
 
@@ -40,4 +45,108 @@ proxy = "ssh -o StrictHostKeyChecking=no -o UserKnownHostsFile=/dev/null localho
 @pytest.mark.parametrize("proxycmd", [None, proxy])
 @pytest.mark.parametrize("debug", [False, True])
 def test_local_ok(cache, proxycmd, debug):
-    _run_variations(Host(debug=debug, cache=cache, proxycmd=proxycmd))
+    with Host(debug=debug, cache=cache, proxycmd=proxycmd) as host:
+        _run_variations(host)
+
+
+def test_local_cwd():
+    with Host() as host:
+        assert host.cwd == os.getcwd()
+        assert host.run("pwd").strip() == os.path.realpath(os.getcwd())
+
+
+def test_local_cwd_quoted(tmpdir):
+    cwd = tmpdir.mkdir("with space's").strpath
+    with Host(cwd=cwd) as host:
+        assert host.run("pwd").strip() == os.path.realpath(cwd)
+
+
+def test_local_copy(tmpdir):
+    src = tmpdir.join("src")
+    src.write("testing\n")
+    cwd = tmpdir.mkdir("cwd")
+    with Host(cwd=cwd.strpath) as host:
+        host.copy_to(src.strpath, "dst")
+        host.copy_many_to([(src.strpath, "dst1"), (src.strpath, "dst2")])
+        host.copy_from("dst", tmpdir.join("back").strpath)
+    assert cwd.join("dst").read() == "testing\n"
+    assert cwd.join("dst1").read() == "testing\n"
+    assert cwd.join("dst2").read() == "testing\n"
+    assert tmpdir.join("back").read() == "testing\n"
+
+
+def test_remote_copy_to(tmpdir):
+    big = tmpdir.join("big")
+    big.write_binary(os.urandom(3 * 1024 * 1024 + 17))
+    empty = tmpdir.join("empty")
+    empty.write_binary(b"")
+    cwd = tmpdir.mkdir("cwd")
+    with Host("localhost", cwd=cwd.strpath) as host:
+        host.copy_to(big.strpath, "big")
+        host.copy_many_to([(empty.strpath, "empty"), (big.strpath, cwd.join("big2").strpath)])
+    assert cwd.join("big").read_binary() == big.read_binary()
+    assert cwd.join("empty").read_binary() == b""
+    assert cwd.join("big2").read_binary() == big.read_binary()
+
+
+def test_remote_copy_from(tmpdir):
+    cwd = tmpdir.mkdir("cwd")
+    big = cwd.join("big")
+    big.write_binary(os.urandom(3 * 1024 * 1024 + 17))
+    with Host("localhost", cwd=cwd.strpath) as host:
+        host.copy_from("big", tmpdir.join("back").strpath)
+    assert tmpdir.join("back").read_binary() == big.read_binary()
+
+
+def test_remote_cwd_cache(monkeypatch):
+    runs = []
+
+    class FakeCommand(object):
+        def __init__(self, command, **kwargs):
+            runs.append((command, kwargs["proxycmd"]))
+
+        def run(self):
+            return "/home/fake\n"
+
+    monkeypatch.setattr(sshutil.host, "SSHCommand", FakeCommand)
+    monkeypatch.setattr(sshutil.host, "_cwd_cache", {})
+
+    assert Host("fakehost", username="fake").cwd == "/home/fake"
+    assert Host("fakehost", username="fake").cwd == "/home/fake"
+    assert runs == [("pwd", None)]
+
+    # A different proxy may reach a different machine with the same name.
+    assert Host("fakehost", username="fake", proxycmd=proxy).cwd == "/home/fake"
+    assert runs == [("pwd", None), ("pwd", proxy)]
+
+
+def test_local_cmd_class():
+    with Host() as host:
+        assert host.cmd_class("echo testing").run() == "testing\n"
+        assert host.session_class is None
+
+
+def test_remote_key_file(tmpdir, monkeypatch, caplog):
+    # No connection is made when cwd is given.
+    host = Host("localhost", cwd="/", password="tests/host_key")
+    assert isinstance(host._cmd_kwargs["password"], ssh.PKey)
+
+    # Existing files that aren't keys are still used as a password, which is never logged.
+    caplog.set_level(logging.DEBUG)
+    host = Host("localhost", cwd="/", password=sys.executable)
+    assert host._cmd_kwargs["password"] == sys.executable
+    assert sys.executable not in caplog.text
+
+    # As are files we can't read.
+    def unreadable(path):
+        raise IOError(13, "Permission denied", path)
+
+    with monkeypatch.context() as m:
+        m.setattr(sshutil.host, "from_private_key_file", unreadable)
+        host = Host("localhost", cwd="/", password=sys.executable)
+        assert host._cmd_kwargs["password"] == sys.executable
+
+    keyfile = tmpdir.join("encrypted_key").strpath
+    ssh.RSAKey.generate(bits=1024).write_private_key_file(keyfile, password="secret")
+    with pytest.raises(ssh.PasswordRequiredException):
+        Host("localhost", cwd="/", password=keyfile)
@@ -22,12 +22,14 @@ import getpass
 import logging
 import socket
 from sshutil.cache import SSHConnectionCache, SSHNoConnectionCache
+import sshutil.cache as cache
 import sshutil.conn as conn
 import sshutil.server as server
 
 logger = logging.getLogger(__name__)
 ssh_server = None
 NC_PORT = None
+HOST_KEY = server.from_private_key_file("tests/host_key")
 SERVER_DEBUG = True
 CLIENT_DEBUG = True
 
@@ -42,7 +44,7 @@ def setup_module(module):
         logger.error("XXX Called setup_module multiple times")
     else:
         server_ctl = server.SSHUserPassController(username=getpass.getuser(), password="admin")
-        ssh_server = server.SSHServer(server_ctl, host_key="tests/host_key", debug=SERVER_DEBUG)
+        ssh_server = server.SSHServer(server_ctl, host_key=HOST_KEY, debug=SERVER_DEBUG)
         setup_module.init = True
 
 
@@ -82,23 +84,107 @@ def test_multi_session():
     logger.debug("Multi-session test complete")
 
 
-def _test_server_close(cache):
-    server_ctl = server.SSHUserPassController(username=getpass.getuser(), password="admin")
-    port = None
-    LAST_INDEX = 40000 + 5000
-    for port in range(40000, LAST_INDEX + 1):
+def test_transport_window():
+    session = conn.SSHSession(
+        "127.0.0.1",
+        password="admin",
+        port=ssh_server.port,
+        debug=CLIENT_DEBUG,
+        cache=SSHNoConnectionCache())
+    assert session.ssh.default_window_size == cache.WINDOW_SIZE
+    assert session.ssh.default_max_packet_size == cache.MAX_PACKET_SIZE
+    session.close()
+
+
+def test_socket_options():
+    session = conn.SSHSession(
+        "127.0.0.1",
+        password="admin",
+        port=ssh_server.port,
+        debug=CLIENT_DEBUG,
+        cache=SSHNoConnectionCache())
+    assert session.ssh.sock.getsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY)
+    session.close()
+
+
+def test_compress_cache_key():
+    cache = SSHConnectionCache("test compress cache")
+    # The test server doesn't enable compression, so this must fall back to none.
+    zsession = conn.SSHSession(
+        "127.0.0.1",
+        password="admin",
+        port=ssh_server.port,
+        debug=CLIENT_DEBUG,
+        cache=cache,
+        compress=True)
+    session = conn.SSHSession(
+        "127.0.0.1",
+        password="admin",
+        port=ssh_server.port,
+        debug=CLIENT_DEBUG,
+        cache=cache,
+        compress=False)
+    assert zsession.is_active()
+    assert session.is_active()
+    assert zsession.ssh is not session.ssh
+    zsession.close()
+    session.close()
+    cache.flush()
+
+
+def _find_port(start, count):
+    """Return the first port in [start, start + count) that can be bound.
+
+    Probe the same way SSHServer binds: IPv6 first, falling back to IPv4.
+    """
+    for port in range(start, start + count):
+        try:
+            sock = socket.socket(socket.AF_INET6, socket.SOCK_STREAM)
+            addr = ('::', port, 0, 0)
+        except socket.error as error:
+            if error.errno != errno.EAFNOSUPPORT:
+                raise
+            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            addr = ('', port)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        try:
+            sock.bind(addr)
+            return port
+        except socket.error as error:
+            if error.errno != errno.EADDRINUSE:
+                raise
+            logger.info("Port %d in use: %s", port, str(error))
+        finally:
+            sock.close()
+    raise RuntimeError("No free port in range {}-{}".format(start, start + count - 1))
+
+
+def _create_server(server_ctl, start, count):
+    """Create an SSHServer on the first free port in [start, start + count)."""
+    end = start + count
+    port = start
+    while True:
+        # Probe with a plain socket, creating a server for each attempt is much more expensive.
+        port = _find_port(port, end - port)
         try:
             logger.info("Create server on port %d", port)
-            ns = server.SSHServer(
-                server_ctl, port=port, host_key="tests/host_key", debug=SERVER_DEBUG)
-            break
+            return server.SSHServer(server_ctl, port=port, host_key=HOST_KEY, debug=SERVER_DEBUG)
         except socket.error as error:
-            logger.info("Got exception: %s %d %d", str(error), error.errno, errno.EADDRINUSE)
-            if error.errno != errno.EADDRINUSE or port == LAST_INDEX:
+            # Someone else may have grabbed the port after we probed it.
+            if error.errno != errno.EADDRINUSE:
                 raise
+            logger.info("Lost race for port %d: %s", port, str(error))
+            port += 1
+
+
+def _test_server_close(cache):
+    server_ctl = server.SSHUserPassController(username=getpass.getuser(), password="admin")
+    ns = _create_server(server_ctl, 40000, 5001)
+    port = ns.port
 
     logger.info("Connect to server on port %d", port)
-    session = conn.SSHSession("127.0.0.1", password="admin", port=port, debug=CLIENT_DEBUG)
+    session = conn.SSHSession(
+        "127.0.0.1", password="admin", port=port, debug=CLIENT_DEBUG, cache=cache)
     session.close()
 
     # force closing of cached client sessions
@@ -114,10 +200,11 @@ def _test_server_close(cache):
 
     for i in range(0, 10):
         logger.debug("Starting %d iteration", i)
-        ns = server.SSHServer(server_ctl, port=port, host_key="tests/host_key", debug=SERVER_DEBUG)
+        ns = server.SSHServer(server_ctl, port=port, host_key=HOST_KEY, debug=SERVER_DEBUG)
 
         logger.info("Connect to server on port %d", port)
-        session = conn.SSHSession("127.0.0.1", password="admin", port=port, debug=CLIENT_DEBUG)
+        session = conn.SSHSession(
+            "127.0.0.1", password="admin", port=port, debug=CLIENT_DEBUG, cache=cache)
         session.close()
         # force closing of cached client sessions
         cache.flush()
@@ -142,9 +229,11 @@ def _test_multi_open(client_cache):
 
     logger.info("Create Server")
     server_ctl = server.SSHUserPassController(username=getpass.getuser(), password="admin")
-    ns = server.SSHServer(server_ctl, port=NC_PORT, host_key="tests/host_key", debug=SERVER_DEBUG)
+    ns = server.SSHServer(server_ctl, port=NC_PORT, host_key=HOST_KEY, debug=SERVER_DEBUG)
     port = ns.port
 
+    # Sessions are opened one at a time, each authenticating before the next connects, so the
+    # server never sees a burst of unauthenticated connections.
     logger.info("Open sessions")
     sessions = [
         conn.SSHSession(
@@ -156,12 +245,11 @@ def _test_multi_open(client_cache):
     for session in sessions:
         session.close()
 
-    session = conn.SSHSession("127.0.0.1", password="admin", port=port, debug=CLIENT_DEBUG)
-
     # These should be cached
     logger.info("Re-opening")
     sessions = [
-        conn.SSHSession("127.0.0.1", password="admin", port=port, debug=CLIENT_DEBUG)
+        conn.SSHSession(
+            "127.0.0.1", password="admin", port=port, debug=CLIENT_DEBUG, cache=client_cache)
         for unused in range(0, 25)
     ]
 
@@ -174,7 +262,8 @@ def _test_multi_open(client_cache):
     # These should be cached
     logger.info("Re-re-opening")
     sessions = [
-        conn.SSHSession("127.0.0.1", password="admin", port=port, debug=CLIENT_DEBUG)
+        conn.SSHSession(
+            "127.0.0.1", password="admin", port=port, debug=CLIENT_DEBUG, cache=client_cache)
         for unused in range(0, 25)
     ]
 